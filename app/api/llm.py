@@ -1,8 +1,13 @@
 """
 API эндпоинты для работы с LLM
 """
+import asyncio
+from typing import AsyncIterator
+
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
 import logging
+import orjson
 
 from app.schemas import (
     ChatRequest,
@@ -20,6 +25,29 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/v1/llm", tags=["LLM API"])
 
 
+def _sse_response(chunks: AsyncIterator[str]) -> StreamingResponse:
+    """
+    Отдаёт части ответа LLM как Server-Sent Events:
+    `data: {"content": ...}` на каждую часть и `data: [DONE]` в конце.
+    """
+    async def events():
+        try:
+            async for chunk in chunks:
+                yield b"data: " + orjson.dumps({"content": chunk}) + b"\n\n"
+        except asyncio.TimeoutError:
+            logger.error("Таймаут потокового запроса к LLM")
+            yield b"event: error\ndata: " + orjson.dumps({"detail": "Таймаут запроса к LLM"}) + b"\n\n"
+            return
+        except Exception as e:
+            # Статус уже отправлен — сообщаем об ошибке отдельным событием
+            logger.error("Ошибка при потоковом запросе к LLM: %s", e)
+            yield b"event: error\ndata: " + orjson.dumps({"detail": str(e)}) + b"\n\n"
+            return
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @router.post("/ask", response_model=SimpleChatResponse, summary="Простой запрос к LLM")
 async def ask(request: SimpleChatRequest):
     """
@@ -33,11 +61,24 @@ async def ask(request: SimpleChatRequest):
             response=response,
             success=True
         )
+    except asyncio.TimeoutError:
+        logger.error("Таймаут запроса к LLM")
+        raise HTTPException(status_code=504, detail="Таймаут запроса к LLM")
     except Exception as e:
-        logger.error(f"Ошибка при запросе к LLM: {e}")
+        logger.error("Ошибка при запросе к LLM: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/ask/stream", summary="Простой запрос к LLM (потоковый ответ)")
+async def ask_stream(request: SimpleChatRequest):
+    """
+    Простой запрос к LLM с потоковым ответом (text/event-stream).
+    Части ответа приходят по мере генерации.
+    """
+    messages = [{"role": "user", "content": request.prompt}]
+    return _sse_response(llm_service.astream(messages, request.model))
+
+
 @router.post("/chat", response_model=ChatResponse, summary="Отправить сообщение в чат")
 async def chat(request: ChatRequest):
     """
@@ -57,12 +98,35 @@ async def chat(request: ChatRequest):
             response=response,
             success=True
         )
+    except asyncio.TimeoutError:
+        logger.error("Таймаут запроса к LLM")
+        raise HTTPException(status_code=504, detail="Таймаут запроса к LLM")
     except Exception as e:
-        logger.error(f"Ошибка при запросе к LLM: {e}")
+        logger.error("Ошибка при запросе к LLM: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/estimate", response_model=EstimationResponse, summary="Оценка проекта")
+@router.post("/chat/stream", summary="Отправить сообщение в чат (потоковый ответ)")
+async def chat_stream(request: ChatRequest):
+    """
+    Отправить сообщение в чат с историей, ответ — потоком (text/event-stream).
+    Части ответа приходят по мере генерации.
+    """
+    messages = [{"role": m.role, "content": m.content} for m in request.messages]
+    return _sse_response(llm_service.astream(
+        messages=messages,
+        model=request.model,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens
+    ))
+
+
+@router.post(
+    "/estimate",
+    response_class=ORJSONResponse,
+    responses={200: {"model": EstimationResponse}},
+    summary="Оценка проекта"
+)
 async def estimate_project(request: EstimationRequest):
     """
     AI-аналитик: полная оценка проекта.
@@ -77,20 +141,27 @@ async def estimate_project(request: EstimationRequest):
             title=request.title,
             spec_text=request.spec_text
         )
-        return EstimationResponse(
-            project=result["project"],
-            tasks=result["tasks"],
-            critical_paths=result.get("critical_paths", []),
-            cost_estimate=result["cost_estimate"],
-            timeline_estimate=result["timeline_estimate"],
-            generated_at=result["generated_at"],
-            success=True
-        )
+        # Ответ отдаётся напрямую, без валидации: EstimationResponse указан
+        # в responses только для документации OpenAPI. project/tasks — это
+        # ответ модели, поля сверх схемы уходят клиенту как есть.
+        return ORJSONResponse(content={
+            "project": result["project"],
+            "tasks": result["tasks"],
+            "critical_paths": result.get("critical_paths", []),
+            "cost_estimate": result["cost_estimate"],
+            "timeline_estimate": result["timeline_estimate"],
+            "generated_at": result["generated_at"],
+            "success": True,
+            "error": None
+        })
     except ValueError as e:
-        logger.error(f"Ошибка валидации: {e}")
+        logger.error("Ошибка валидации: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
+    except asyncio.TimeoutError:
+        logger.error("Таймаут запроса к LLM при оценке проекта")
+        raise HTTPException(status_code=504, detail="Таймаут запроса к LLM")
     except Exception as e:
-        logger.error(f"Ошибка при оценке проекта: {e}")
+        logger.error("Ошибка при оценке проекта: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -0,0 +1,148 @@
+"""
+Асинхронный micro-batcher.
+Собирает запросы, пришедшие в течение короткого окна, в одну пачку
+и обрабатывает её одним вызовом.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Batcher:
+    """
+    Копит элементы в очереди и передаёт их пачками в `process_batch`.
+
+    `process_batch` получает список элементов и возвращает список результатов
+    той же длины и в том же порядке. Если на месте результата стоит исключение,
+    оно пробрасывается только соответствующему вызывающему.
+
+    Если задан `max_batch_weight`, пачка закрывается раньше, как только
+    следующий элемент превысил бы суммарный вес (например, бюджет токенов).
+    Элемент тяжелее бюджета уходит отдельной пачкой.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 8,
+        batch_window: float = 0.05,
+        max_batch_weight: Optional[int] = None,
+        weigh: Optional[Callable[[Any], int]] = None,
+    ):
+        self._process_batch = process_batch
+        self._max_batch_size = max(1, max_batch_size)
+        self._batch_window = max(0.0, batch_window)
+        self._max_batch_weight = max_batch_weight
+        self._weigh = weigh or (lambda item: 1)
+        self._queue: Optional[asyncio.Queue] = None
+        # Элемент, не влезший в предыдущую пачку, — открывает следующую
+        self._carry: Optional[Tuple[Any, asyncio.Future]] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self) -> None:
+        """Запустить фоновый обработчик (вызывать внутри работающего event loop)"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить обработчик и отменить все ожидающие запросы"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        tasks = [self._worker, *self._in_flight]
+        for t in self._in_flight:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker = None
+
+        if self._carry is not None:
+            _, fut = self._carry
+            self._carry = None
+            if not fut.done():
+                fut.cancel()
+        while not self._queue.empty():
+            _, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.cancel()
+
+    async def process(self, item: Any) -> Any:
+        """Поставить элемент в очередь и дождаться его результата"""
+        if not self.running:
+            raise RuntimeError("Batcher не запущен")
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, fut))
+        return await fut
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._carry is not None:
+                entry, self._carry = self._carry, None
+            else:
+                entry = await self._queue.get()
+            batch = [entry]
+            weight = self._weigh(entry[0])
+            deadline = loop.time() + self._batch_window
+
+            while len(batch) < self._max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+                item_weight = self._weigh(entry[0])
+                if self._max_batch_weight is not None and weight + item_weight > self._max_batch_weight:
+                    self._carry = entry
+                    break
+                batch.append(entry)
+                weight += item_weight
+
+            # Пачку обрабатываем отдельной задачей, чтобы следующая
+            # собиралась, пока текущая ждёт ответа LLM
+            task = asyncio.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        # Клиент мог отключиться, пока запрос лежал в очереди
+        batch = [(item, fut) for item, fut in batch if not fut.done()]
+        if not batch:
+            return
+
+        try:
+            results = await self._process_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"process_batch вернул {len(results)} результатов на {len(batch)} элементов"
+                )
+        except asyncio.CancelledError:
+            # stop() отменил обработку — вызывающие не должны ждать вечно
+            for _, fut in batch:
+                fut.cancel()
+            raise
+        except Exception as e:
+            logger.error("Ошибка обработки пачки из %d элементов: %s", len(batch), e)
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for (_, fut), result in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(result, BaseException):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
@@ -1,4 +1,4 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
 
 
@@ -7,6 +7,9 @@ class Settings(BaseSettings):
     
     # Server
     SERVER_PORT: int = 8080
+    # Каждый процесс держит свои лимиты LLM, кэш и batcher:
+    # исходящая конкурентность к GigaChat = SERVER_WORKERS * LLM_MAX_CONCURRENCY
+    SERVER_WORKERS: int = 1
     DEBUG: bool = False
     
     # GigaChat настройки
@@ -14,10 +17,33 @@ class Settings(BaseSettings):
     GIGACHAT_SCOPE: str = "GIGACHAT_API_PERS"
     GIGACHAT_MODEL: str = "GigaChat"
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
-        extra = "ignore"
+    # Ограничения на исходящие запросы к LLM
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_TIMEOUT_SECONDS: float = 120.0
+    LLM_MAX_STREAMS: int = 4
+    LLM_STREAM_IDLE_TIMEOUT_SECONDS: float = 30.0
+    # Прогрев выполняется в фоне и не задерживает старт
+    LLM_WARMUP_TIMEOUT_SECONDS: float = 10.0
+    # Синхронные вызовы GigaChat в пуле из LLM_THREADS потоков вместо ainvoke
+    LLM_FORCE_SYNC: bool = False
+    LLM_THREADS: int = 8
+    
+    # Micro-batching запросов /estimate: ТЗ разных клиентов в одном промпте,
+    # поэтому по умолчанию выключено
+    ANALYST_BATCH_ENABLED: bool = False
+    ANALYST_BATCH_WINDOW_MS: int = 50
+    ANALYST_MAX_BATCH: int = 4
+    ANALYST_MAX_BATCH_TOKENS: int = 12000  # вход + выход на одну пачку
+    
+    # Кэш ответов /estimate (0 — выключен)
+    ANALYST_CACHE_SIZE: int = 1024
+    ANALYST_CACHE_TTL: int = 3600
+    
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        case_sensitive=True,
+        extra="ignore",
+    )
 
 
 settings = Settings()
@@ -2,14 +2,19 @@
 Agent Estimator Service - Python FastAPI версия
 AI-агент для оценки проектов на базе GigaChat
 """
+import asyncio
+import contextlib
 import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
 from app.api import llm_router
+from app.services.llm_service import llm_service
+from app.services.analyst_service import analyst_service
 
 # Настройка логирования
 logging.basicConfig(
@@ -22,9 +27,17 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifecycle события приложения"""
-    logger.info(f"🚀 Agent Estimator Service запускается...")
-    logger.info(f"   LLM: GigaChat ({settings.GIGACHAT_MODEL})")
+    logger.info("🚀 Agent Estimator Service запускается...")
+    logger.info("   LLM: GigaChat (%s)", settings.GIGACHAT_MODEL)
+    # Прогрев в фоне: /health должен отвечать, пока GigaChat не ответил
+    warmup_task = asyncio.create_task(llm_service.warmup())
+    analyst_service.start_batching()
     yield
+    warmup_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await warmup_task
+    await analyst_service.stop_batching()
+    llm_service.close()
     logger.info("👋 Agent Estimator Service останавливается...")
 
 
@@ -42,6 +55,7 @@ app = FastAPI(
     """,
     version="2.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/swagger-ui.html",
     redoc_url="/redoc",
     openapi_url="/api-docs"
@@ -82,9 +96,15 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
+    # reload работает только с одним процессом
+    workers = 1 if settings.DEBUG else max(1, settings.SERVER_WORKERS)
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=settings.SERVER_PORT,
+        workers=workers,
+        # uvloop и httptools ставятся с uvicorn[standard]; "auto" берёт их, если доступны
+        loop="auto",
+        http="auto",
         reload=settings.DEBUG
     )
@@ -1,14 +1,19 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Dict, Any, Union
 
 
-class ChatMessage(BaseModel):
+class BaseSchema(BaseModel):
+    """Базовая схема: лишние поля отбрасываются, присваивание не валидируется"""
+    model_config = ConfigDict(extra="ignore", validate_assignment=False)
+
+
+class ChatMessage(BaseSchema):
     """Сообщение в чате"""
     role: str = Field(..., description="Роль: system, user, assistant")
     content: str = Field(..., description="Содержимое сообщения")
 
 
-class ChatRequest(BaseModel):
+class ChatRequest(BaseSchema):
     """Запрос на чат с LLM"""
     model: Optional[str] = Field(None, description="Модель LLM (опционально)")
     messages: List[ChatMessage] = Field(..., description="История сообщений")
@@ -16,7 +21,7 @@ class ChatRequest(BaseModel):
     max_tokens: int = Field(2000, ge=1, le=8000, description="Максимум токенов")
 
 
-class ChatResponse(BaseModel):
+class ChatResponse(BaseSchema):
     """Ответ от LLM"""
     model: str = Field(..., description="Использованная модель")
     response: str = Field(..., description="Ответ LLM")
@@ -24,37 +29,43 @@ class ChatResponse(BaseModel):
     error: Optional[str] = Field(None, description="Сообщение об ошибке")
 
 
-class SimpleChatRequest(BaseModel):
+class SimpleChatRequest(BaseSchema):
     """Простой запрос к LLM"""
     prompt: str = Field(..., description="Текст запроса")
     model: Optional[str] = Field(None, description="Модель (опционально)")
 
 
-class SimpleChatResponse(BaseModel):
+class SimpleChatResponse(BaseSchema):
     """Простой ответ от LLM"""
     model: str = Field(..., description="Использованная модель")
     response: str = Field(..., description="Ответ LLM")
     success: bool = Field(True, description="Успешность запроса")
 
 
-class EstimationRequest(BaseModel):
+class EstimationRequest(BaseSchema):
     """Запрос на оценку проекта"""
     title: str = Field(..., description="Название проекта")
     spec_text: str = Field(..., description="Техническое задание")
 
 
-class TaskInfo(BaseModel):
-    """Информация о задаче"""
+class TaskInfo(BaseSchema):
+    """
+    Информация о задаче.
+    Задачи приходят от LLM как есть: числовые id приводятся к строке,
+    пропущенные поля допустимы, лишние поля сохраняются.
+    """
+    model_config = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+    
     id: str
-    title: str
+    title: Optional[str] = None
     description: Optional[str] = None
-    hours: int
-    priority: str
-    role: str
+    hours: Union[int, float] = 0
+    priority: Optional[str] = None
+    role: str = "default"
     depends_on: List[str] = []
 
 
-class CostBreakdown(BaseModel):
+class CostBreakdown(BaseSchema):
     """Разбивка стоимости"""
     id: str
     title: str
@@ -64,13 +75,13 @@ class CostBreakdown(BaseModel):
     cost: float
 
 
-class CostEstimate(BaseModel):
+class CostEstimate(BaseSchema):
     """Оценка стоимости"""
     breakdown: List[CostBreakdown]
     total: float
 
 
-class TaskSchedule(BaseModel):
+class TaskSchedule(BaseSchema):
     """Расписание задачи"""
     id: str
     title: str
@@ -82,7 +93,7 @@ class TaskSchedule(BaseModel):
     depends_on: List[str] = []
 
 
-class TimelineEstimate(BaseModel):
+class TimelineEstimate(BaseSchema):
     """Оценка сроков"""
     project_start: str
     project_end: str
@@ -91,16 +102,16 @@ class TimelineEstimate(BaseModel):
     task_schedule: List[TaskSchedule]
 
 
-class ProjectInfo(BaseModel):
+class ProjectInfo(BaseSchema):
     """Информация о проекте"""
     title: str
     summary: str
 
 
-class EstimationResponse(BaseModel):
+class EstimationResponse(BaseSchema):
     """Полный ответ с оценкой проекта"""
     project: ProjectInfo
-    tasks: List[Dict[str, Any]]
+    tasks: List[TaskInfo]
     critical_paths: List[Any] = []
     cost_estimate: CostEstimate
     timeline_estimate: TimelineEstimate
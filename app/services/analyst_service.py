@@ -4,11 +4,19 @@
 """
 import re
 import json
+import asyncio
+import hashlib
 import logging
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
-from app.services.llm_service import llm_service
+import orjson
+from cachetools import TTLCache
+
+from app.core.batcher import Batcher
+from app.core.config import settings
+from app.services.llm_service import LLM_ERRORS, llm_service
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +32,18 @@ DEFAULT_RATES_PER_HOUR = {
     "default": 500
 }
 
+_WS_RE = re.compile(r"\s+")
+_JSON_BLOCK_RE = re.compile(r"```json\s*(\{.*?\})\s*```", re.DOTALL)
+_LINE_COMMENT_RE = re.compile(r"//.*?$", re.MULTILINE)
+_JSON_DECODER = json.JSONDecoder()
+
+# Лимит ответа модели на одно ТЗ
+_TASKS_MAX_TOKENS = 2000
+
 
 def _clean_text(s: str) -> str:
     """Очистка текста от лишних пробелов"""
-    return re.sub(r'\s+', ' ', s).strip()
+    return _WS_RE.sub(' ', s).strip()
 
 
 def _format_date(dt: datetime) -> str:
@@ -35,58 +51,47 @@ def _format_date(dt: datetime) -> str:
     return dt.strftime("%d.%m.%Y")
 
 
-def _extract_json_block(text: str) -> Optional[str]:
+def _extract_json_block(text: str) -> Optional[Any]:
     """
-    Извлекает JSON блок из текста.
+    Извлекает и парсит JSON блок из текста.
     Поддерживает ```json ... ``` и просто { ... }
     """
     # Сначала ищем ```json``` блок
-    m = re.search(r"```json\s*(\{.*?\})\s*```", text, flags=re.DOTALL)
+    m = _JSON_BLOCK_RE.search(text)
     if m:
-        return m.group(1)
+        try:
+            return orjson.loads(m.group(1))
+        except orjson.JSONDecodeError:
+            pass
 
-    # Ищем первый { ... } блок
+    # Ищем первый { ... } блок.
+    # raw_decode сам находит конец объекта и учитывает скобки внутри строк
     start = text.find("{")
     if start == -1:
         return None
-    
-    depth = 0
-    for i in range(start, len(text)):
-        if text[i] == "{":
-            depth += 1
-        elif text[i] == "}":
-            depth -= 1
-            if depth == 0:
-                return text[start:i+1]
-    return None
+    try:
+        obj, _ = _JSON_DECODER.raw_decode(text, start)
+    except json.JSONDecodeError:
+        return None
+    return obj
 
 
-class AnalystService:
-    """Сервис AI-аналитика для оценки проектов"""
-    
-    async def generate_tasks_from_spec(
-        self, 
-        title: str, 
-        spec_text: str
-    ) -> Dict[str, Any]:
-        """
-        Генерирует структурированный список задач из ТЗ.
-        Возвращает JSON с проектом, задачами и критическими путями.
-        """
-        title = _clean_text(title)
-        spec_text = _clean_text(spec_text)
+SYSTEM_PROMPT = "Ты — проект-аналитик, создающий планы для разработки."
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
 
-        prompt = f"""
+# Статическая часть промптов собирается один раз при импорте;
+# на каждый запрос подставляются только название и ТЗ
+_PROMPT_PREFIX = """
 Ты — профессиональный проект-аналитик. Преобразуй техническое задание в строгий формат JSON для планирования проекта.
 
 Шаблон ответа (обязательный):
-{{
-  "project": {{
+{
+  "project": {
     "title": "<Название проекта>",
     "summary": "<Краткое описание проекта>"
-  }},
+  },
   "tasks": [
-    {{
+    {
       "id": "T1",
       "title": "Название задачи",
       "description": "Описание для исполнителя, 1-2 предложения.",
@@ -94,46 +99,292 @@ class AnalystService:
       "priority": "высокий|средний|низкий",
       "role": "backend|frontend|devops|qa|ux|pm",
       "depends_on": []
-    }}
+    }
   ],
   "critical_paths": []
-}}
+}
 
 Требования:
-- Верни ТОЛЬКО JSON без JSON внутри ```json``` блока.
+- Верни ТОЛЬКО JSON-объект: без ```json``` блока, пояснений и комментариев.
 - Hours — целое число.
 - Поля role/priority — из указанных значений.
 
-Входные данные:
+"""
+
+_PROMPT_SUFFIX_TMPL = """Входные данные:
 Название проекта: {title}
 ТЗ: {spec_text}
 
-Верни только JSON (или JSON в ```json``` блоке).
+Верни только JSON.
 """
 
+_BATCH_PROMPT_PREFIX = """
+Ты — профессиональный проект-аналитик. Тебе передано несколько технических заданий. Преобразуй КАЖДОЕ из них в строгий формат JSON для планирования проекта.
+
+Шаблон ответа (обязательный):
+{
+  "results": [
+    {
+      "index": 0,
+      "project": {
+        "title": "<Название проекта из входных данных, без изменений>",
+        "summary": "<Краткое описание проекта>"
+      },
+      "tasks": [
+        {
+          "id": "T1",
+          "title": "Название задачи",
+          "description": "Описание для исполнителя, 1-2 предложения.",
+          "hours": 8,
+          "priority": "высокий|средний|низкий",
+          "role": "backend|frontend|devops|qa|ux|pm",
+          "depends_on": []
+        }
+      ],
+      "critical_paths": []
+    }
+  ]
+}
+
+Требования:
+- В "results" ровно один элемент на каждое ТЗ, "index" — номер ТЗ из входных данных.
+- "project.title" — название проекта из входных данных дословно.
+- ТЗ оцениваются независимо друг от друга.
+- Верни ТОЛЬКО JSON-объект: без ```json``` блока, пояснений и комментариев.
+- Hours — целое число.
+- Поля role/priority — из указанных значений.
+
+"""
+
+_BATCH_ITEM_TMPL = "[{index}] Название проекта: {title}\nТЗ: {spec_text}"
+
+_BATCH_PROMPT_SUFFIX_TMPL = """Входные данные ({count} ТЗ):
+{inputs}
+
+Верни только JSON.
+"""
+
+
+def _build_prompt(title: str, spec_text: str) -> str:
+    """Промпт для разбора одного ТЗ"""
+    return _PROMPT_PREFIX + _PROMPT_SUFFIX_TMPL.format(title=title, spec_text=spec_text)
+
+
+def _build_batch_prompt(items: List[Tuple[str, str]]) -> str:
+    """Промпт для разбора нескольких ТЗ одним запросом"""
+    inputs = "\n\n".join(
+        _BATCH_ITEM_TMPL.format(index=i, title=title, spec_text=spec_text)
+        for i, (title, spec_text) in enumerate(items)
+    )
+    return _BATCH_PROMPT_PREFIX + _BATCH_PROMPT_SUFFIX_TMPL.format(count=len(items), inputs=inputs)
+
+
+def _approx_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (~4 символа на токен)"""
+    return len(text) // 4 + 1
+
+
+def _batch_item_tokens(item: Tuple[str, str]) -> int:
+    """Вес ТЗ в пачке: входные токены плюс резерв под ответ"""
+    title, spec_text = item
+    return _approx_tokens(title) + _approx_tokens(spec_text) + _TASKS_MAX_TOKENS
+
+
+def _cache_key(title: str, spec_text: str) -> str:
+    """Ключ кэша по названию и ТЗ"""
+    return hashlib.blake2b(f"{title}\0{spec_text}".encode(), digest_size=16).hexdigest()
+
+
+def _is_valid_result(parsed: Any) -> bool:
+    """Ответ модели пригоден для оценки: объект со списком задач"""
+    return isinstance(parsed, dict) and isinstance(parsed.get("tasks"), list)
+
+
+def _match_batch_results(
+    results: List[Any],
+    items: List[Tuple[str, str]]
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Сопоставляет элементы пакетного ответа с входными ТЗ по "index".
+    В пачке ТЗ разных клиентов, поэтому элемент принимается, только если
+    индекс встречается один раз, ответ пригоден для оценки и название
+    проекта совпадает с входным. Остальные ТЗ переотправляются по одному.
+    """
+    by_index: Dict[int, Dict[str, Any]] = {}
+    seen = set()
+    duplicated = set()
+    for r in results:
+        if not isinstance(r, dict):
+            continue
+        i = r.pop("index", None)
+        if not isinstance(i, int) or not 0 <= i < len(items):
+            continue
+        if i in seen:
+            duplicated.add(i)
+            continue
+        seen.add(i)
+
+        project = r.get("project")
+        returned_title = project.get("title") if isinstance(project, dict) else None
+        if not _is_valid_result(r) or not isinstance(returned_title, str):
+            continue
+        if _clean_text(returned_title).casefold() != items[i][0].casefold():
+            continue
+        by_index[i] = r
+
+    for i in duplicated:
+        by_index.pop(i, None)
+    return by_index
+
+
+def _parse_llm_json(raw_response: str) -> Dict[str, Any]:
+    """Извлекает и парсит JSON-объект из ответа модели (ValueError, если объекта нет)"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Ответ модели (%d символов): %s", len(raw_response), raw_response[:2000])
+
+    # Промпт требует чистый JSON-объект — в норме ответ парсится целиком.
+    # Массив или строку не принимаем: объект ищем внутри ответа ниже
+    try:
+        parsed = orjson.loads(raw_response)
+    except orjson.JSONDecodeError:
+        parsed = None
+    if isinstance(parsed, dict):
+        return parsed
+
+    # Модель всё же обернула JSON текстом или ```json``` блоком
+    parsed = _extract_json_block(raw_response)
+    if not isinstance(parsed, dict):
+        # Пробуем убрать комментарии
+        parsed = _extract_json_block(_LINE_COMMENT_RE.sub("", raw_response))
+    if not isinstance(parsed, dict):
+        raise ValueError(f"Не удалось извлечь JSON из ответа модели: {raw_response[:500]}")
+    return parsed
+
+
+class AnalystService:
+    """Сервис AI-аналитика для оценки проектов"""
+    
+    def __init__(self):
+        self._batcher: Optional[Batcher] = None
+        # Повторный запрос с тем же ТЗ получает ту же оценку без нового вызова LLM.
+        # Ответ модели не строго детерминирован, поэтому кэш — это
+        # осознанная фиксация первой оценки на ANALYST_CACHE_TTL
+        self._cache: Optional[TTLCache] = None
+        if settings.ANALYST_CACHE_SIZE > 0:
+            self._cache = TTLCache(maxsize=settings.ANALYST_CACHE_SIZE, ttl=settings.ANALYST_CACHE_TTL)
+        self._cache_lock = asyncio.Lock()
+    
+    def start_batching(self) -> None:
+        """
+        Включает micro-batching: запросы, пришедшие в течение
+        ANALYST_BATCH_WINDOW_MS, уходят в GigaChat одним вызовом,
+        пока пачка укладывается в ANALYST_MAX_BATCH_TOKENS.
+        """
+        if not settings.ANALYST_BATCH_ENABLED or settings.ANALYST_MAX_BATCH <= 1:
+            return
+        self._batcher = Batcher(
+            self._generate_batch,
+            max_batch_size=settings.ANALYST_MAX_BATCH,
+            batch_window=settings.ANALYST_BATCH_WINDOW_MS / 1000,
+            max_batch_weight=settings.ANALYST_MAX_BATCH_TOKENS,
+            weigh=_batch_item_tokens,
+        )
+        self._batcher.start()
+    
+    async def stop_batching(self) -> None:
+        """Останавливает micro-batching"""
+        if self._batcher is not None:
+            await self._batcher.stop()
+            self._batcher = None
+    
+    async def generate_tasks_from_spec(
+        self, 
+        title: str, 
+        spec_text: str
+    ) -> Dict[str, Any]:
+        """
+        Генерирует структурированный список задач из ТЗ.
+        Возвращает JSON с проектом, задачами и критическими путями.
+        """
+        title = _clean_text(title)
+        spec_text = _clean_text(spec_text)
+
+        if self._cache is None:
+            return await self._generate(title, spec_text)
+
+        key = _cache_key(title, spec_text)
+        async with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            logger.info("Ответ для ТЗ взят из кэша")
+            return cached
+
+        parsed = await self._generate(title, spec_text)
+        # Кэшируем только ответ, пригодный для оценки, чтобы неудачный
+        # ответ модели не возвращался всем повторам до истечения TTL
+        if _is_valid_result(parsed):
+            async with self._cache_lock:
+                self._cache[key] = parsed
+        return parsed
+
+    async def _generate(self, title: str, spec_text: str) -> Dict[str, Any]:
+        """Запрос к LLM — через micro-batcher, если он запущен"""
+        if self._batcher is not None and self._batcher.running:
+            return await self._batcher.process((title, spec_text))
+        return await self._generate_single(title, spec_text)
+
+    async def _generate_single(self, title: str, spec_text: str) -> Dict[str, Any]:
+        """Один запрос к LLM на одно ТЗ"""
         messages = [
-            {"role": "system", "content": "Ты — проект-аналитик, создающий планы для разработки."},
-            {"role": "user", "content": prompt}
+            _SYSTEM_MESSAGE,
+            {"role": "user", "content": _build_prompt(title, spec_text)}
         ]
 
-        raw_response = await llm_service.chat(messages, temperature=0.0, max_tokens=2000)
+        raw_response = await llm_service.chat(messages, temperature=0.0, max_tokens=_TASKS_MAX_TOKENS)
+        return _parse_llm_json(raw_response)
+
+    async def _generate_batch(self, items: List[Tuple[str, str]]) -> List[Any]:
+        """
+        Один запрос к LLM на пачку ТЗ.
+        ТЗ, для которых модель не вернула результат, переотправляются по одному.
+        """
+        if len(items) == 1:
+            return [await self._generate_single(*items[0])]
 
-        # Извлекаем JSON
-        json_block = _extract_json_block(raw_response)
-        if not json_block:
-            raise ValueError(f"Не удалось извлечь JSON из ответа модели: {raw_response[:500]}")
+        messages = [
+            _SYSTEM_MESSAGE,
+            {"role": "user", "content": _build_batch_prompt(items)}
+        ]
 
+        by_index: Dict[int, Dict[str, Any]] = {}
         try:
-            parsed = json.loads(json_block)
-        except json.JSONDecodeError as e:
-            # Пробуем убрать комментарии
-            cleaned = re.sub(r"//.*?$", "", json_block, flags=re.MULTILINE)
-            try:
-                parsed = json.loads(cleaned)
-            except Exception as e2:
-                raise ValueError(f"JSON парсинг не удался: {e}. Очищенный: {e2}")
-        
-        return parsed
+            raw_response = await llm_service.chat(
+                messages, temperature=0.0, max_tokens=_TASKS_MAX_TOKENS * len(items)
+            )
+            parsed = _parse_llm_json(raw_response)
+            results = parsed.get("results")
+            by_index = _match_batch_results(results if isinstance(results, list) else [], items)
+        except ValueError as e:
+            logger.warning("Не удалось разобрать пакетный ответ модели: %s", e)
+        except (asyncio.TimeoutError, *LLM_ERRORS) as e:
+            # Пакетная генерация в N раз длиннее одиночной — при таймауте
+            # или ошибке GigaChat не валим всех N клиентов, а переотправляем
+            # их ТЗ по одному
+            logger.warning("Ошибка пакетного запроса из %d ТЗ: %r", len(items), e)
+
+        missing = [i for i in range(len(items)) if i not in by_index]
+        if missing:
+            logger.warning(
+                "Пакетный ответ без результатов для %d из %d ТЗ, переотправляем по одному",
+                len(missing), len(items)
+            )
+            retried = await asyncio.gather(
+                *(self._generate_single(*items[i]) for i in missing),
+                return_exceptions=True
+            )
+            by_index.update(zip(missing, retried))
+
+        return [by_index[i] for i in range(len(items))]
 
     def estimate_cost(
         self, 
@@ -146,13 +397,17 @@ class AnalystService:
         if rates is None:
             rates = DEFAULT_RATES_PER_HOUR
         
+        # Поиск ставки по умолчанию и метод dict — один раз, вне цикла
+        get_rate = rates.get
+        default_rate = rates["default"]
+        
         breakdown = []
         total = 0.0
         
         for t in tasks:
             hours = int(t.get("hours", 0))
             role = t.get("role", "default")
-            rate = rates.get(role, rates["default"])
+            rate = get_rate(role, default_rate)
             cost = hours * rate
             
             breakdown.append({
@@ -187,39 +442,43 @@ class AnalystService:
         for k in deps_map:
             deps_map[k] = {d for d in deps_map[k] if d in id_map}
 
-        # Топологическая сортировка
-        remaining = set(id_map.keys())
+        # Топологическая сортировка (алгоритм Кана)
+        indeg = {tid: len(deps) for tid, deps in deps_map.items()}
+        children = defaultdict(list)
+        for tid, deps in deps_map.items():
+            for d in deps:
+                children[d].append(tid)
+        
+        queue = deque(tid for tid, n in indeg.items() if n == 0)
         ordered = []
         
-        while remaining:
-            ready = [r for r in remaining if not deps_map[r]]
-            if not ready:
-                ready = list(remaining)
-            
-            for r in ready:
-                ordered.append(id_map[r])
-                remaining.remove(r)
-                for k in deps_map:
-                    deps_map[k].discard(r)
+        while queue:
+            tid = queue.popleft()
+            ordered.append(id_map[tid])
+            for c in children[tid]:
+                indeg[c] -= 1
+                if indeg[c] == 0:
+                    queue.append(c)
+        
+        # Задачи в циклах зависимостей — в конец, в исходном порядке
+        if len(ordered) < len(id_map):
+            ordered.extend(id_map[tid] for tid, n in indeg.items() if n > 0)
 
         # Вычисляем расписание
-        def hours_to_days(h):
-            return max(1, (h + daily_capacity_hours - 1) // daily_capacity_hours)
+        cap_round_up = daily_capacity_hours - 1
 
         dates_for_id = {}
+        end_for_id = {}
         role_next_free = {}
 
         for t in ordered:
             role = t.get("role", "default")
             hours = int(t.get("hours", 0))
-            duration_days = hours_to_days(hours)
+            duration_days = max(1, (hours + cap_round_up) // daily_capacity_hours)
             
             # Вычисляем earliest_start
             deps = t.get("depends_on", []) or []
-            deps_end = [
-                datetime.strptime(dates_for_id[d]["end_date"], "%d.%m.%Y") 
-                for d in deps if d in dates_for_id
-            ]
+            deps_end = [end_for_id[d] for d in deps if d in end_for_id]
             
             earliest = project_start
             if deps_end:
@@ -230,8 +489,8 @@ class AnalystService:
             start = max(earliest, role_free)
             end = start + timedelta(days=duration_days - 1)
             
-            # Добавляем буфер 20%
-            buffer_days = max(0, int(round(duration_days * 0.2)))
+            # Добавляем буфер 20% (целочисленно: то же, что round(duration_days * 0.2))
+            buffer_days = (duration_days + 2) // 5
             end_with_buffer = end + timedelta(days=buffer_days)
             
             dates_for_id[t["id"]] = {
@@ -244,31 +503,28 @@ class AnalystService:
                 "duration_days": duration_days + buffer_days,
                 "depends_on": deps
             }
+            end_for_id[t["id"]] = end_with_buffer
             
             role_next_free[role] = end_with_buffer + timedelta(days=1)
 
         # Итоговые даты
-        if dates_for_id:
-            project_end = max(
-                datetime.strptime(v["end_date"], "%d.%m.%Y") 
-                for v in dates_for_id.values()
-            )
+        if end_for_id:
+            project_end = max(end_for_id.values())
         else:
             project_end = project_start
         
         total_days = (project_end - project_start).days + 1
 
         # Дни по ролям
-        role_days = {}
+        role_days = defaultdict(int)
         for v in dates_for_id.values():
-            role_days.setdefault(v["role"], 0)
             role_days[v["role"]] += v["duration_days"]
 
         return {
             "project_start": _format_date(project_start),
             "project_end": _format_date(project_end),
             "total_work_days": total_days,
-            "role_days": role_days,
+            "role_days": dict(role_days),
             "task_schedule": list(dates_for_id.values())
         }
 
@@ -285,11 +541,12 @@ class AnalystService:
         
         tasks = parsed.get("tasks", [])
         
-        # 2) Оценка стоимости
-        cost = self.estimate_cost(tasks)
-        
-        # 3) Оценка сроков
-        timeline = self.estimate_timeline(tasks, project_start=datetime.now())
+        # 2) Оценка стоимости и 3) оценка сроков — чистый CPU,
+        # выполняем в потоках, чтобы не блокировать event loop
+        cost, timeline = await asyncio.gather(
+            asyncio.to_thread(self.estimate_cost, tasks),
+            asyncio.to_thread(self.estimate_timeline, tasks, datetime.now())
+        )
 
         return {
             "project": parsed.get("project", {"title": title, "summary": ""}),
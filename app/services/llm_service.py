@@ -1,13 +1,27 @@
 """
 Сервис для работы с GigaChat LLM
 """
+import asyncio
+import functools
 import logging
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, List, Dict, Optional
+
+import httpx
 
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Ошибки транспорта и API GigaChat (таймауты, обрывы соединения, ответы с ошибкой)
+_llm_errors = [httpx.TransportError]
+try:
+    from gigachat.exceptions import GigaChatException
+    _llm_errors.append(GigaChatException)
+except ImportError:
+    pass
+LLM_ERRORS = tuple(_llm_errors)
+
 
 class GigaChatProvider:
     """Провайдер для GigaChat (Сбер)"""
@@ -17,6 +31,7 @@ class GigaChatProvider:
         self.scope = settings.GIGACHAT_SCOPE
         self.model = settings.GIGACHAT_MODEL
         self._chat_model = None
+        self._executor: Optional[ThreadPoolExecutor] = None
     
     def _get_model(self):
         if self._chat_model is None:
@@ -27,11 +42,18 @@ class GigaChatProvider:
                     scope=self.scope,
                     model=self.model,
                     verify_ssl_certs=False,
+                    # Иначе у клиента свой таймаут HTTP (30 с), короче LLM_TIMEOUT_SECONDS
+                    timeout=settings.LLM_TIMEOUT_SECONDS,
                 )
             except ImportError:
                 raise ImportError("langchain-gigachat не установлен")
         return self._chat_model
     
+    @staticmethod
+    def _generation_params(temperature: float, max_tokens: int) -> Dict[str, Any]:
+        # Передаются в payload запроса GigaChat поверх настроек модели
+        return {"temperature": temperature, "max_tokens": max_tokens}
+    
     async def chat(
         self,
         messages: List[Dict[str, str]],
@@ -40,7 +62,17 @@ class GigaChatProvider:
         max_tokens: int = 2000
     ) -> str:
         llm = self._get_model()
-        response = llm.invoke(messages)
+        params = self._generation_params(temperature, max_tokens)
+        if not settings.LLM_FORCE_SYNC:
+            response = await llm.ainvoke(messages, **params)
+        else:
+            # Явно включённый синхронный клиент (например, при проблемах
+            # с его async-транспортом) — не блокируем event loop,
+            # вызов уходит в отдельный ограниченный пул потоков
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                self._get_executor(), functools.partial(llm.invoke, messages, **params)
+            )
         
         # Извлекаем текст из ответа
         if hasattr(response, 'content'):
@@ -50,6 +82,37 @@ class GigaChatProvider:
         else:
             return str(response)
     
+    async def astream(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: float = 0.0,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[str]:
+        llm = self._get_model()
+        params = self._generation_params(temperature, max_tokens)
+        async for chunk in llm.astream(messages, **params):
+            content = getattr(chunk, 'content', None)
+            if content:
+                yield content
+    
+    async def warmup(self) -> None:
+        llm = self._get_model()
+        await llm.aget_models()
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.LLM_THREADS,
+                thread_name_prefix="gigachat",
+            )
+        return self._executor
+    
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
     def get_model_name(self) -> str:
         return self.model
 
@@ -59,6 +122,11 @@ class LLMService:
     
     def __init__(self):
         self._provider: Optional[GigaChatProvider] = None
+        # Не больше LLM_MAX_CONCURRENCY одновременных запросов к GigaChat.
+        # У потоковых ответов свой лимит: долгие SSE-клиенты не должны
+        # занимать слоты обычных /ask, /chat и /estimate
+        self._sem = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        self._stream_sem = asyncio.Semaphore(settings.LLM_MAX_STREAMS)
     
     def _get_provider(self) -> GigaChatProvider:
         if self._provider is None:
@@ -72,15 +140,75 @@ class LLMService:
         temperature: float = 0.0,
         max_tokens: int = 2000
     ) -> str:
-        """Отправить сообщение в чат GigaChat"""
+        """
+        Отправить сообщение в чат GigaChat.
+        Ожидание свободного слота и сам запрос ограничены LLM_TIMEOUT_SECONDS.
+        """
         provider = self._get_provider()
-        return await provider.chat(messages, model, temperature, max_tokens)
+        
+        async def _call() -> str:
+            async with self._sem:
+                return await provider.chat(messages, model, temperature, max_tokens)
+        
+        try:
+            return await asyncio.wait_for(_call(), timeout=settings.LLM_TIMEOUT_SECONDS)
+        except httpx.TimeoutException as e:
+            # Таймаут HTTP-клиента — тот же таймаут запроса к LLM
+            raise asyncio.TimeoutError(f"Таймаут HTTP-запроса к GigaChat: {e!r}") from e
+    
+    async def astream(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: float = 0.0,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый ответ GigaChat по частям.
+        Ожидание слота ограничено LLM_TIMEOUT_SECONDS, пауза между
+        частями ответа — LLM_STREAM_IDLE_TIMEOUT_SECONDS.
+        """
+        provider = self._get_provider()
+        await asyncio.wait_for(self._stream_sem.acquire(), timeout=settings.LLM_TIMEOUT_SECONDS)
+        try:
+            chunks = provider.astream(messages, model, temperature, max_tokens)
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            chunks.__anext__(), timeout=settings.LLM_STREAM_IDLE_TIMEOUT_SECONDS
+                        )
+                    except StopAsyncIteration:
+                        break
+                    except httpx.TimeoutException as e:
+                        raise asyncio.TimeoutError(f"Таймаут HTTP-запроса к GigaChat: {e!r}") from e
+                    yield chunk
+            finally:
+                await chunks.aclose()
+        finally:
+            self._stream_sem.release()
     
     async def ask(self, prompt: str, model: Optional[str] = None) -> str:
         """Простой запрос к GigaChat"""
         messages = [{"role": "user", "content": prompt}]
         return await self.chat(messages, model)
     
+    async def warmup(self) -> None:
+        """
+        Прогрев GigaChat при старте приложения: лёгкий запрос списка моделей
+        получает OAuth-токен и открывает TLS-соединение, чтобы за это
+        не платил первый пользовательский запрос.
+        """
+        try:
+            await asyncio.wait_for(self._get_provider().warmup(), timeout=settings.LLM_WARMUP_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error("Не удалось прогреть GigaChat: %r", e)
+    
+    def close(self) -> None:
+        """Освободить ресурсы провайдера при остановке приложения"""
+        if self._provider is not None:
+            self._provider.close()
+    
     def get_model_name(self) -> str:
         """Получить название модели"""
         return self._get_provider().get_model_name()
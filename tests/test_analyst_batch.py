@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+import orjson
+import pytest
+
+from app.services import analyst_service as analyst_module
+from app.services.analyst_service import AnalystService
+
+ITEMS = [("Магазин", "ТЗ магазина"), ("Блог", "ТЗ блога")]
+
+
+def _result(title, index=None):
+    r = {"project": {"title": title, "summary": ""}, "tasks": [{"id": "T1"}]}
+    if index is not None:
+        r["index"] = index
+    return r
+
+
+@pytest.fixture
+def fake_chat(monkeypatch):
+    """Подменяет llm_service.chat: пакетный вызов отдаёт batch_reply, одиночные — по названию"""
+    state = {"batch_reply": None, "single_calls": []}
+
+    async def chat(messages, model=None, temperature=0.0, max_tokens=2000):
+        prompt = messages[-1]["content"]
+        if '"results"' in prompt:
+            reply = state["batch_reply"]
+            if isinstance(reply, BaseException):
+                raise reply
+            return reply
+        title = next(t for t, _ in ITEMS if f"Название проекта: {t}" in prompt)
+        state["single_calls"].append(title)
+        return orjson.dumps(_result(title)).decode()
+
+    monkeypatch.setattr(analyst_module.llm_service, "chat", chat)
+    return state
+
+
+@pytest.mark.asyncio
+async def test_batch_results_are_mapped_by_index(fake_chat):
+    fake_chat["batch_reply"] = orjson.dumps(
+        {"results": [_result("Блог", 1), _result("Магазин", 0)]}
+    ).decode()
+
+    results = await AnalystService()._generate_batch(ITEMS)
+
+    assert [r["project"]["title"] for r in results] == ["Магазин", "Блог"]
+    assert fake_chat["single_calls"] == []
+
+
+@pytest.mark.asyncio
+async def test_mismatched_title_is_retried_singly(fake_chat):
+    # Модель перепутала индексы — оценки не должны уйти чужим клиентам
+    fake_chat["batch_reply"] = orjson.dumps(
+        {"results": [_result("Блог", 0), _result("Магазин", 1)]}
+    ).decode()
+
+    results = await AnalystService()._generate_batch(ITEMS)
+
+    assert [r["project"]["title"] for r in results] == ["Магазин", "Блог"]
+    assert sorted(fake_chat["single_calls"]) == ["Блог", "Магазин"]
+
+
+@pytest.mark.asyncio
+async def test_duplicated_index_is_retried_singly(fake_chat):
+    fake_chat["batch_reply"] = orjson.dumps(
+        {"results": [_result("Магазин", 0), _result("Магазин", 0), _result("Блог", 1)]}
+    ).decode()
+
+    results = await AnalystService()._generate_batch(ITEMS)
+
+    assert [r["project"]["title"] for r in results] == ["Магазин", "Блог"]
+    assert fake_chat["single_calls"] == ["Магазин"]
+
+
+@pytest.mark.asyncio
+async def test_batch_timeout_retries_every_item_singly(fake_chat):
+    fake_chat["batch_reply"] = asyncio.TimeoutError()
+
+    results = await AnalystService()._generate_batch(ITEMS)
+
+    assert [r["project"]["title"] for r in results] == ["Магазин", "Блог"]
+    assert sorted(fake_chat["single_calls"]) == ["Блог", "Магазин"]
+
+
+@pytest.mark.asyncio
+async def test_batch_http_timeout_retries_every_item_singly(fake_chat):
+    # Пакетный вызов с большим max_tokens первым упирается в таймаут HTTP-клиента
+    fake_chat["batch_reply"] = httpx.ReadTimeout("read timed out")
+
+    results = await AnalystService()._generate_batch(ITEMS)
+
+    assert [r["project"]["title"] for r in results] == ["Магазин", "Блог"]
+    assert sorted(fake_chat["single_calls"]) == ["Блог", "Магазин"]
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from app.core.batcher import Batcher
+
+
+def _recording_batcher(**kwargs):
+    calls = []
+
+    async def process(items):
+        calls.append(list(items))
+        await asyncio.sleep(0.01)
+        return [ValueError(item) if item == "bad" else item * 10 for item in items]
+
+    return Batcher(process, **kwargs), calls
+
+
+@pytest.mark.asyncio
+async def test_groups_concurrent_items_by_max_batch_size():
+    batcher, calls = _recording_batcher(max_batch_size=4, batch_window=0.05)
+    batcher.start()
+    try:
+        results = await asyncio.gather(*(batcher.process(i) for i in range(6)))
+    finally:
+        await batcher.stop()
+
+    assert results == [0, 10, 20, 30, 40, 50]
+    assert calls == [[0, 1, 2, 3], [4, 5]]
+
+
+@pytest.mark.asyncio
+async def test_exception_result_fails_only_its_caller():
+    batcher, _ = _recording_batcher(max_batch_size=4, batch_window=0.05)
+    batcher.start()
+    try:
+        results = await asyncio.gather(
+            batcher.process(1), batcher.process("bad"), batcher.process(2),
+            return_exceptions=True
+        )
+    finally:
+        await batcher.stop()
+
+    assert results[0] == 10 and results[2] == 20
+    assert isinstance(results[1], ValueError)
+
+
+@pytest.mark.asyncio
+async def test_process_batch_error_fails_whole_batch():
+    async def process(items):
+        raise RuntimeError("boom")
+
+    batcher = Batcher(process, max_batch_size=4, batch_window=0.05)
+    batcher.start()
+    try:
+        results = await asyncio.gather(
+            batcher.process(1), batcher.process(2), return_exceptions=True
+        )
+    finally:
+        await batcher.stop()
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_weight_budget_carries_item_into_next_batch():
+    batcher, calls = _recording_batcher(
+        max_batch_size=10, batch_window=0.05, max_batch_weight=10, weigh=lambda x: x
+    )
+    batcher.start()
+    try:
+        results = await asyncio.gather(*(batcher.process(i) for i in [3, 4, 5, 12, 1, 2]))
+    finally:
+        await batcher.stop()
+
+    assert results == [30, 40, 50, 120, 10, 20]
+    # 5 не влезает к 3+4, 12 тяжелее бюджета и уходит один
+    assert calls == [[3, 4], [5], [12], [1, 2]]
+
+
+@pytest.mark.asyncio
+async def test_stop_cancels_in_flight_and_queued_items():
+    started = asyncio.Event()
+
+    async def process(items):
+        started.set()
+        await asyncio.sleep(10)
+
+    batcher = Batcher(process, max_batch_size=1, batch_window=0)
+    batcher.start()
+    first = asyncio.create_task(batcher.process(1))
+    await started.wait()
+    second = asyncio.create_task(batcher.process(2))
+    await asyncio.sleep(0)
+
+    await batcher.stop()
+
+    results = await asyncio.gather(first, second, return_exceptions=True)
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+    assert not batcher.running
+
+
+@pytest.mark.asyncio
+async def test_process_requires_running_batcher():
+    batcher, _ = _recording_batcher()
+    with pytest.raises(RuntimeError):
+        await batcher.process(1)
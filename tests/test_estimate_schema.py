@@ -0,0 +1,23 @@
+from app.main import app
+from app.schemas.llm import TaskInfo
+
+
+def test_estimate_publishes_estimation_response():
+    spec = app.openapi()
+    schema = spec["paths"]["/api/v1/llm/estimate"]["post"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert schema == {"$ref": "#/components/schemas/EstimationResponse"}
+
+    task = spec["components"]["schemas"]["TaskInfo"]
+    assert task["required"] == ["id"]
+    assert task["additionalProperties"] is True
+
+
+def test_task_info_accepts_raw_llm_tasks():
+    first = TaskInfo.model_validate({"id": 1, "hours": 2.5, "extra": "x"})
+    second = TaskInfo.model_validate({"id": "T2", "title": "API"})
+
+    assert first.id == "1"
+    assert first.hours == 2.5
+    assert first.model_extra == {"extra": "x"}
+    assert second.role == "default"
+    assert second.depends_on == []